@@ -1,12 +1,15 @@
 from fastapi import FastAPI, Form, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import rag
 from fastapi.middleware.cors import CORSMiddleware
 from auth import router as auth_router
 from router import ask_llm
-import tempfile
-import os
+import re
+
+_BULLET_RE = re.compile(r"\n[-*•]\s+")
+_SENT_RE = re.compile(r"(?<=\.)\s+")
 
 
 def _to_structured(
@@ -21,16 +24,12 @@ def _to_structured(
     """
     txt = (answer_text or '').strip()
     # Simple summary and points heuristic (can be overridden)
-    computed_summary = txt[:200] + ('...' if len(txt) > 200 else '')
-    # Try to split into bullet-like points
-    raw_points = []
-    for sep in ['\n- ', '\n• ', '\n* ']:
-        if sep in txt:
-            raw_points = [p.strip() for p in txt.split(sep) if p.strip()]
-            break
-    if not raw_points:
+    computed_summary = txt[:200] + '...' if len(txt) > 200 else txt
+    # Try to split into bullet-like points ("- ", "• ", "* " at line start)
+    raw_points = [p.strip() for p in _BULLET_RE.split(txt) if p.strip()]
+    if len(raw_points) <= 1:
         # Fallback: split by sentences (very light)
-        raw_points = [s.strip() for s in txt.replace('\n', ' ').split('. ') if s.strip()]
+        raw_points = [s.strip() for s in _SENT_RE.split(txt.replace('\n', ' ')) if s.strip()]
         raw_points = raw_points[:5]
     points = raw_points[:6]
 
@@ -82,12 +81,13 @@ class AskRequest(BaseModel):
 
 
 @app.post("/ask")
-def ask(req: AskRequest):
+async def ask(req: AskRequest):
     """Run either direct LLM (ai mode) or RAG (default/web mode)."""
     temperature = req.temperature if req.temperature is not None else 0.1
     mode = (req.mode or "").lower()
     if mode == "ai":
-        text = rag.answer_direct(
+        text = await run_in_threadpool(
+            rag.answer_direct,
             req.question,
             model=req.model,
             max_tokens=req.max_tokens,
@@ -95,7 +95,7 @@ def ask(req: AskRequest):
         )
         return _to_structured(text, [], title="AI Response")
     # Default to RAG/web pipeline
-    result = rag.answer(
+    result = await rag.answer(
         req.question,
         model=req.model,
         max_tokens=req.max_tokens,
@@ -140,24 +140,19 @@ async def ask_form(
     # Default model if none provided
     chosen_model = model
     if mode_l == "ai":
-        # If an image is provided, use ask_llm directly with image file path
+        # If an image is provided, send its bytes straight to ask_llm
         if image is not None:
-            # Persist upload to a temp file to pass a path to ask_llm
-            suffix = os.path.splitext(image.filename or "upload")[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                content = await image.read()
-                tmp.write(content)
-                tmp_path = tmp.name
-            try:
-                answer_text = ask_llm(chosen_model or "openrouter/auto", question, tmp_path)
-            finally:
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+            image_bytes = await image.read()
+            answer_text = await ask_llm(
+                chosen_model or "openrouter/auto",
+                question,
+                image_bytes=image_bytes,
+                image_mime=image.content_type or "image/png",
+            )
         else:
             # No image; use direct LLM path already in RAG module
-            answer_text = rag.answer_direct(
+            answer_text = await run_in_threadpool(
+                rag.answer_direct,
                 question,
                 model=chosen_model,
                 max_tokens=None,
@@ -165,7 +160,7 @@ async def ask_form(
             )
         return _to_structured(answer_text, [], title="AI Response")
     # Web mode -> use RAG; image is currently ignored
-    result = rag.answer(
+    result = await rag.answer(
         question,
         model=chosen_model,
         max_tokens=None,
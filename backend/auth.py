@@ -6,6 +6,10 @@ from utils import verify_google_token
 
 router = APIRouter()
 
+# Stable for the process lifetime; read once instead of per request
+_JWT_SECRET = os.getenv('JWT_SECRET', 'dev-secret').encode()
+_JWT_ALG = 'HS256'
+
 @router.post('/verify')
 async def verify_id_token(request: Request, id_token: str | None = Body(None, embed=True)):
     # Accept Google ID token from JSON body or Authorization: Bearer <id_token>
@@ -21,12 +25,11 @@ async def verify_id_token(request: Request, id_token: str | None = Body(None, em
     if not user_info:
         raise HTTPException(status_code=401, detail='Invalid Google ID token')
     # Issue JWT for your app
-    jwt_secret = os.getenv('JWT_SECRET', 'dev-secret')
     payload = {
         'sub': user_info['sub'],
         'email': user_info.get('email'),
         'name': user_info.get('name'),
         'exp': datetime.utcnow() + timedelta(hours=12),
     }
-    token_jwt = jwt.encode(payload, jwt_secret, algorithm='HS256')
+    token_jwt = jwt.encode(payload, _JWT_SECRET, algorithm=_JWT_ALG)
     return {'token': token_jwt, 'user': user_info}
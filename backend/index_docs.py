@@ -1,12 +1,21 @@
 # Script to ingest files into Chroma DB
 
 import os
+import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
 PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
-# Use a fresh collection to store 1024-dim MRL embeddings to avoid conflicts with old 384-dim index
-COLLECTION = "hc_docs_mrl"
+# Use a fresh collection: cosine-space HNSW over normalized 1024-dim MRL embeddings.
+# Chroma fixes the distance metric at creation, so the old L2 "hc_docs_mrl" can't be reused.
+COLLECTION = "hc_docs_mrl_cos"
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+EMBEDDING_MODEL = "static-retrieval-mrl-en-v1"
 
 # robust imports (some LangChain versions differ)
 try:
@@ -30,6 +39,54 @@ try:
 except Exception:
     from langchain.vectorstores import Chroma
 
+_EMBEDDER = None
+
+def _get_embedder():
+    """Load the sentence-transformer once and reuse it for every index call."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        _EMBEDDER = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL)
+    return _EMBEDDER
+
+EMBED_BATCH_SIZE = 256
+# Chroma rejects single add() calls above its max batch size (~5k rows)
+CHROMA_ADD_BATCH = 4096
+
+def _add_chunks(chunks):
+    """Embed chunk texts in large batches and write them straight to the collection.
+
+    Encoding goes through the underlying SentenceTransformer so each forward pass
+    covers EMBED_BATCH_SIZE chunks, instead of LangChain's per-document path.
+    """
+    embeddings = _get_embedder()
+    texts = [c.page_content for c in chunks]
+    metas = [c.metadata for c in chunks]
+    vecs = embeddings.client.encode(
+        texts,
+        batch_size=EMBED_BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=True,
+        normalize_embeddings=True,
+    )
+    db = Chroma(
+        persist_directory=PERSIST_DIR,
+        collection_name=COLLECTION,
+        embedding_function=embeddings,
+        collection_metadata=COLLECTION_METADATA,
+    )
+    # Random ids so repeated runs append instead of overwriting earlier chunks
+    ids = [str(uuid.uuid4()) for _ in texts]
+    for start in range(0, len(texts), CHROMA_ADD_BATCH):
+        end = start + CHROMA_ADD_BATCH
+        db._collection.add(
+            embeddings=vecs[start:end].tolist(),
+            documents=texts[start:end],
+            metadatas=metas[start:end],
+            ids=ids[start:end],
+        )
+    db.persist()
+    return db
+
 def _is_pdf(path: str) -> bool:
     return os.path.isfile(path) and path.lower().endswith(".pdf")
 
@@ -49,15 +106,10 @@ def index_pdf(path):
     docs = loader.load()  # list of Document objects (keeps page metadata)
     splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150)
     chunks = splitter.split_documents(docs)
-
-    embeddings = SentenceTransformerEmbeddings(model_name="static-retrieval-mrl-en-v1")
-    db = Chroma.from_documents(
-        chunks,
-        embedding=embeddings,
-        persist_directory=PERSIST_DIR,
-        collection_name=COLLECTION,
-    )
-    db.persist()
+    if not chunks:
+        print("No content found to index.")
+        return
+    _add_chunks(chunks)
     print(f"Indexed {len(chunks)} chunks into {PERSIST_DIR}/{COLLECTION}")
 
 def index_many(paths):
@@ -74,14 +126,7 @@ def index_many(paths):
     if not all_chunks:
         print("No content found to index.")
         return
-    embeddings = SentenceTransformerEmbeddings(model_name="static-retrieval-mrl-en-v1")
-    db = Chroma.from_documents(
-        all_chunks,
-        embedding=embeddings,
-        persist_directory=PERSIST_DIR,
-        collection_name=COLLECTION,
-    )
-    db.persist()
+    _add_chunks(all_chunks)
     print(
         f"Indexed {len(all_chunks)} chunks from {len(paths)} PDF file(s) (pages: {total_docs}) into {PERSIST_DIR}/{COLLECTION}"
     )
@@ -1,27 +1,31 @@
-# RAG pipeline: retrieval and generation (modern chains)
+# RAG pipeline: retrieval and generation
 from __future__ import annotations
 
+import asyncio
+import functools
 import os
+import threading
 from typing import List, Dict, Any
 
 from dotenv import load_dotenv
-from datetime import timedelta
 import re
 
 # HTTP + caching and extraction for web fallback
-import requests
-import requests_cache
+import httpx
 import trafilatura
 from bs4 import BeautifulSoup
+from cachetools import TTLCache
+import tiktoken
 import openai
 from urllib.parse import urlparse
-from web_fetcher import filter_trusted
+from web_fetcher import iter_trusted
+from semantic_cache import SemanticCache
 
 load_dotenv()
 
 PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
-# Use a fresh collection name for the new 1024-dim embeddings
-COLLECTION = "hc_docs_mrl"
+# Use a fresh collection name for the cosine-space 1024-dim embeddings (see index_docs.py)
+COLLECTION = "hc_docs_mrl_cos"
 
 # No need to remap OPENAI_* env vars; we pass api_key/base_url directly to ChatOpenAI
 
@@ -34,24 +38,22 @@ from duckduckgo_search import DDGS
 # Chat model via OpenAI-compatible client pointing to OpenRouter
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 from langchain.schema import Document
 
 DEFAULT_MODEL = os.getenv("RAG_MODEL", "openrouter/auto")
 DEFAULT_MAX_TOKENS = int(os.getenv("RAG_MAX_TOKENS", "3000"))
 WEB_CACHE_TTL_HOURS = int(os.getenv("WEB_CACHE_TTL_HOURS", "24"))
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+WEB_FETCH_CONCURRENCY = int(os.getenv("WEB_FETCH_CONCURRENCY", "8"))
+EMBEDDING_MODEL = "static-retrieval-mrl-en-v1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_HOURS = int(os.getenv("SEMANTIC_CACHE_TTL_HOURS", "24"))
 
-# Trusted domains for live medical retrieval
-TRUSTED_DOMAINS = ("who.int", "cdc.gov", "nih.gov", "medlineplus.gov", "pubmed.ncbi.nlm.nih.gov")
-
-# Install a persistent cached session for web fetches
-requests_cache.install_cache(
-    cache_name="web_cache",
-    backend="sqlite",
-    expire_after=timedelta(hours=WEB_CACHE_TTL_HOURS),
-)
+# Extracted page text by URL. Web fetches go through httpx, so this replaces the
+# old process-wide requests_cache patch, which also cached unrelated traffic
+# (Google token certs, PDF downloads, NCBI calls).
+_PAGE_CACHE: TTLCache = TTLCache(maxsize=512, ttl=WEB_CACHE_TTL_HOURS * 3600)
 
 # Allowed models (keep in sync with /models endpoint in app.py)
 ALLOWED_MODELS = {
@@ -62,6 +64,32 @@ ALLOWED_MODELS = {
 }
 
 
+_EMBEDDER = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def _get_embedder() -> SentenceTransformerEmbeddings:
+    """Load the sentence-transformer once per process.
+    Called from worker threads, so concurrent first requests must not each load it.
+    """
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None:
+                _EMBEDDER = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL)
+    return _EMBEDDER
+
+
+# Answers for near-duplicate questions are served from here instead of re-running
+# web search + fetch + generation.
+_ANSWER_CACHE = SemanticCache(
+    lambda q: _get_embedder().embed_query(q),
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=SEMANTIC_CACHE_TTL_HOURS * 3600,
+    capacity=1024,
+)
+
+
 def _get_llm(model: str | None = None, temperature: float = 0.1, max_tokens: int | None = None):
     return ChatOpenAI(
         model=model or DEFAULT_MODEL,
@@ -74,8 +102,6 @@ def _get_llm(model: str | None = None, temperature: float = 0.1, max_tokens: int
     )
 
 
-# create a document-combiner (stuff) and retrieval chain
-
 # Some providers (e.g., google/gemma via OpenRouter) do not support a system role.
 # Build prompts conditionally.
 _SYSTEM_INSTRUCTION = (
@@ -96,6 +122,7 @@ _prompt_user_only = ChatPromptTemplate.from_messages([
     ),
 ])
 
+@functools.lru_cache(maxsize=32)
 def _supports_system_role(model: str | None) -> bool:
     if not model:
         return True
@@ -103,15 +130,26 @@ def _supports_system_role(model: str | None) -> bool:
     return not model.startswith("google/gemma")
 
 
+@functools.lru_cache(maxsize=32)
 def _get_prompt_for_model(model: str | None) -> ChatPromptTemplate:
     return _prompt_with_system if _supports_system_role(model) else _prompt_user_only
 
 
-def _build_chain(model: str | None = None, temperature: float = 0.1, max_tokens: int | None = None):
-    llm = _get_llm(model=model, temperature=temperature, max_tokens=max_tokens)
-    prompt = _get_prompt_for_model(model)
-    doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    return create_retrieval_chain(retriever=retriever, combine_docs_chain=doc_chain)
+def _build_messages(question: str, docs: list[Document], model: str | None = None):
+    """Render the prompt for `model` with docs stuffed into {context}.
+    Same layout as LangChain's stuff-documents chain, without its runnable overhead.
+    """
+    context = "\n\n".join(d.page_content for d in docs)
+    return _get_prompt_for_model(model).format_messages(input=question, context=context)
+
+
+@functools.lru_cache(maxsize=1024)
+def _url_host(url: str) -> str:
+    """Host of `url` without a leading "www." ("" if it cannot be parsed)."""
+    try:
+        return urlparse(url).netloc.replace("www.", "")
+    except Exception:
+        return ""
 
 
 def _source_title_from_meta(meta: dict) -> str:
@@ -121,11 +159,7 @@ def _source_title_from_meta(meta: dict) -> str:
         return str(title)
     src = meta.get("source") or meta.get("file_path") or meta.get("path") or "unknown"
     if isinstance(src, str) and src.startswith("http"):
-        try:
-            u = urlparse(src)
-            return (u.netloc or "web").replace("www.", "")
-        except Exception:
-            return "web"
+        return _url_host(src) or "web"
     # fallback to filename
     try:
         return str(src).split("/")[-1]
@@ -147,12 +181,12 @@ def _google_search_trusted(query: str, max_results: int = 5) -> list[str]:
     return []
 
 
-# -------- Web fallback utilities (now prefers Tavily) --------
-def _tavily_search(query: str, max_results: int = 20) -> list[str]:
+# -------- Web fallback utilities (Tavily raced against DuckDuckGo) --------
+async def _tavily_search(client: httpx.AsyncClient, query: str, max_results: int = 20) -> list[str]:
     if not TAVILY_API_KEY:
         return []
     try:
-        r = requests.post(
+        r = await client.post(
             "https://api.tavily.com/search",
             json={
                 "api_key": TAVILY_API_KEY,
@@ -165,39 +199,24 @@ def _tavily_search(query: str, max_results: int = 20) -> list[str]:
         )
         r.raise_for_status()
         data = r.json() or {}
-        urls = []
-        for item in data.get("results", [])[:max_results]:
-            url = item.get("url")
-            if url:
-                urls.append(url)
+        urls = [item.get("url") for item in data.get("results", [])[:max_results] if item.get("url")]
         # Dedup while preserving order
-        seen, out = set(), []
-        for u in urls:
-            if u not in seen:
-                seen.add(u)
-                out.append(u)
-        return out
+        return list(dict.fromkeys(urls))[:max_results]
     except Exception:
         return []
+
+
 def _ddg_search_trusted(query: str, max_results: int = 5) -> list[str]:
     results = []
     try:
-        for r in DDGS().text(query, max_results=max_results):
-            url = r.get("href") or r.get("url")
-            if not url:
-                continue
-            if any(d in url for d in TRUSTED_DOMAINS):
-                results.append(url)
+        hits = (r.get("href") or r.get("url") for r in DDGS().text(query, max_results=max_results))
+        # Same trusted-domain matcher as web_fetcher.filter_trusted
+        for url in iter_trusted(u for u in hits if u):
+            results.append(url)
     except Exception:
         pass
     # Deduplicate while preserving order
-    seen = set()
-    deduped = []
-    for u in results:
-        if u not in seen:
-            seen.add(u)
-            deduped.append(u)
-    return deduped
+    return list(dict.fromkeys(results))[:max_results]
 
 
 def _serpapi_search_trusted(query: str, max_results: int = 5) -> list[str]:
@@ -205,120 +224,196 @@ def _serpapi_search_trusted(query: str, max_results: int = 5) -> list[str]:
     return []
 
 
-def _search_trusted(query: str, max_results: int = 12) -> list[str]:
-    # Provider preference: Tavily -> DuckDuckGo (DDGS)
-    urls = _tavily_search(query, max_results=max_results)
+# Search results keyed by (normalized query, max_results); skips the provider round trip
+_SEARCH_CACHE: TTLCache = TTLCache(maxsize=2048, ttl=SEARCH_CACHE_TTL_SECONDS)
+_SEARCH_CACHE_LOCK = threading.Lock()
+
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+async def _search_trusted(client: httpx.AsyncClient, query: str, max_results: int = 12) -> list[str]:
+    """Race Tavily and DuckDuckGo and return the first non-empty trusted URL list.
+    Latency is min(Tavily, DDG) rather than Tavily followed by DDG on a miss.
+    """
+    key = (_normalize_query(query), max_results)
+    with _SEARCH_CACHE_LOCK:
+        cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        return list(cached)
+    pending = {
+        asyncio.create_task(_tavily_search(client, query, max_results=max_results)),
+        # DDGS is a blocking client; keep it off the event loop
+        asyncio.create_task(asyncio.to_thread(_ddg_search_trusted, query, max_results=max_results)),
+    }
+    urls: list[str] = []
+    try:
+        while pending and not urls:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if not t.cancelled() and t.exception() is None and t.result():
+                    urls = t.result()
+                    break
+    finally:
+        for t in pending:
+            t.cancel()
+    # Don't pin empty results (provider outage) for the whole TTL
     if urls:
-        return urls
-    return _ddg_search_trusted(query, max_results=max_results)
+        with _SEARCH_CACHE_LOCK:
+            _SEARCH_CACHE[key] = tuple(urls)
+    return urls
+
+
+def _extract_main_text(html: str) -> str | None:
+    """Extract readable text from an HTML page (trafilatura, then BeautifulSoup)."""
+    # First try trafilatura
+    downloaded = trafilatura.extract(html, include_comments=False, include_tables=False)
+    if downloaded and len(downloaded.strip()) > 200:
+        return downloaded.strip()
+    # Fallback to BeautifulSoup-based cleaning
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "header", "footer", "nav"]):
+        tag.extract()
+    text = soup.get_text(separator="\n")
+    cleaned = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    if len(cleaned) > 200:
+        return cleaned
+    return None
 
 
-def _fetch_and_extract(url: str) -> str | None:
+async def _fetch_and_extract_async(client: httpx.AsyncClient, url: str) -> str | None:
+    cached = _PAGE_CACHE.get(url)
+    if cached is not None:
+        return cached
     try:
-        resp = requests.get(url, timeout=20)
+        resp = await client.get(url, timeout=20)
         resp.raise_for_status()
-        html = resp.text
-        # First try trafilatura
-        downloaded = trafilatura.extract(html, include_comments=False, include_tables=False)
-        if downloaded and len(downloaded.strip()) > 200:
-            return downloaded.strip()
-        # Fallback to BeautifulSoup-based cleaning
-        soup = BeautifulSoup(html, "html.parser")
-        for tag in soup(["script", "style", "header", "footer", "nav"]):
-            tag.extract()
-        text = soup.get_text(separator="\n")
-        cleaned = "\n".join(line.strip() for line in text.splitlines() if line.strip())
-        if len(cleaned) > 200:
-            return cleaned
+        # Parsing is CPU-bound; run it in a worker so other fetches keep flowing
+        text = await asyncio.to_thread(_extract_main_text, resp.text)
     except Exception:
         return None
-    return None
+    if text:
+        _PAGE_CACHE[url] = text
+    return text
 
 
-def _web_fallback_docs(question: str, max_pages: int = 12) -> list[Document]:
+async def _web_fallback_docs(question: str, max_pages: int = 12) -> list[Document]:
     """Fetch trusted web pages and return as LangChain Documents.
-    Uses `_search_trusted` to find URLs, then `_fetch_and_extract` to get clean text.
+    Uses `_search_trusted` to find URLs, then fetches them concurrently (bounded by
+    `WEB_FETCH_CONCURRENCY`) so wall time tracks the slowest page, not the sum.
     """
     docs: list[Document] = []
-    try:
-        urls = _search_trusted(question, max_results=max_pages)
-    except Exception:
-        urls = []
-    for url in urls:
+    async with httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+        headers={"User-Agent": "medimind/1.0"},
+    ) as client:
         try:
-            content = _fetch_and_extract(url)
-            if not content or len(content.strip()) < 200:
-                continue
-            meta = {"source": url}
-            try:
-                u = urlparse(url)
-                if u.netloc:
-                    meta["title"] = u.netloc.replace("www.", "")
-            except Exception:
-                pass
-            docs.append(Document(page_content=content.strip(), metadata=meta))
-            if len(docs) >= max_pages:
-                break
+            urls = await _search_trusted(client, question, max_results=max_pages)
         except Exception:
+            urls = []
+        if not urls:
+            return docs
+
+        sem = asyncio.Semaphore(WEB_FETCH_CONCURRENCY)
+
+        async def bound(coro):
+            async with sem:
+                return await coro
+
+        results = await asyncio.gather(
+            *(bound(_fetch_and_extract_async(client, u)) for u in urls),
+            return_exceptions=True,
+        )
+
+    # Keep search ranking order when assembling documents
+    for url, content in zip(urls, results):
+        if isinstance(content, BaseException) or not content or len(content.strip()) < 200:
             continue
+        meta = {"source": url}
+        host = _url_host(url)
+        if host:
+            meta["title"] = host
+        docs.append(Document(page_content=content.strip(), metadata=meta))
+        if len(docs) >= max_pages:
+            break
     return docs
 
 
+_ENCODING = None
+_ENCODING_UNAVAILABLE = object()  # sentinel: load failed, don't hit the network again
+
+
+def _get_encoding():
+    """Load the cl100k_base tokenizer once; tiktoken fetches its BPE file on first use.
+    Returns None (and keeps returning None) if the load fails, e.g. offline.
+    """
+    global _ENCODING
+    if _ENCODING is None:
+        try:
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _ENCODING = _ENCODING_UNAVAILABLE
+    return None if _ENCODING is _ENCODING_UNAVAILABLE else _ENCODING
+
+
 def _shrink_documents(
     docs: list[Document],
     *,
     max_docs: int = 8,
-    max_chars_per_doc: int = 1500,
-    total_char_limit: int = 8000,
+    max_tokens_per_doc: int = 500,
+    total_token_limit: int = 3000,
 ) -> list[Document]:
     """Cap number and size of documents to keep prompt within token budget.
-    Roughly assumes 4 chars ~= 1 token. Adjust as needed.
+    Counts real tokens with tiktoken; falls back to ~4 chars per token if the
+    tokenizer cannot be loaded (e.g. offline).
     """
     if not docs:
         return []
+    enc = _get_encoding()
     out: list[Document] = []
     used = 0
     for d in docs[:max_docs]:
         text = (d.page_content or "").strip()
         if not text:
             continue
-        # Trim per-doc
-        if len(text) > max_chars_per_doc:
-            text = text[:max_chars_per_doc]
         # Enforce total cap
-        remain = total_char_limit - used
+        remain = total_token_limit - used
         if remain <= 0:
             break
-        if len(text) > remain:
-            text = text[:remain]
-        used += len(text)
+        budget = min(max_tokens_per_doc, remain)
+        if enc is not None:
+            ids = enc.encode(text, disallowed_special=())
+            if len(ids) > budget:
+                ids = ids[:budget]
+                text = enc.decode(ids)
+            used += len(ids)
+        else:
+            text = text[: budget * 4]
+            used += -(-len(text) // 4)
         out.append(Document(page_content=text, metadata=d.metadata))
     return out
 
 def _format_sources_from_docs(docs: list[Document], *, question: str | None = None) -> list[dict]:
-    """Turn Documents into UI-friendly sources: [{title, url, snippet}]."""
+    """Turn Documents into UI-friendly sources: [{title, url, snippet}].
+    Built and deduplicated by (title, url, snippet) in a single pass.
+    """
     out: list[dict] = []
-    # Optional similarity map if needed in future
+    seen: set[tuple] = set()
     for d in docs:
         meta = getattr(d, "metadata", None) or {}
         src = meta.get("source") or meta.get("file_path") or meta.get("path") or "unknown"
         title = _source_title_from_meta(meta)
-        snippet = (getattr(d, "page_content", "") or "").strip()[:280]
-        out.append({
-            "title": title,
-            "url": src if isinstance(src, str) and src.startswith("http") else None,
-            "snippet": snippet if snippet else None,
-        })
-    # Deduplicate by (title,url,snippet)
-    dedup: list[dict] = []
-    seen: set[tuple] = set()
-    for s in out:
-        sig = (s.get("title"), s.get("url"), s.get("snippet"))
+        url = src if isinstance(src, str) and src.startswith("http") else None
+        snippet = (getattr(d, "page_content", "") or "").strip()[:280] or None
+        sig = (title, url, snippet)
         if sig in seen:
             continue
         seen.add(sig)
-        dedup.append(s)
-    return dedup
+        out.append({"title": title, "url": url, "snippet": snippet})
+    return out
 
 
 def answer_direct(
@@ -334,15 +429,11 @@ def answer_direct(
         model = DEFAULT_MODEL
     llm = _get_llm(model=model, temperature=temperature, max_tokens=max_tokens)
     # Reuse shared prompt builder that always includes {context}
-    prompt = _get_prompt_for_model(model)
-    doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    out = doc_chain.invoke({"input": question, "context": []})
-    if isinstance(out, dict):
-        return out.get("answer") or out.get("output_text") or out.get("result") or str(out)
-    return str(out)
+    resp = llm.invoke(_build_messages(question, [], model))
+    return str(resp.content)
 
 
-def answer(
+async def answer(
     question: str,
     *,
     model: str | None = None,
@@ -355,14 +446,32 @@ def answer(
     if model and model not in ALLOWED_MODELS:
         model = DEFAULT_MODEL
 
-    web_docs = _web_fallback_docs(question, max_pages=(web_max_results or 12))
-    web_docs = _shrink_documents(web_docs)
-    llm = _get_llm(model=model, temperature=temperature, max_tokens=max_tokens)
-    prompt = _get_prompt_for_model(model)
-    doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    web_out = doc_chain.invoke({"input": question, "context": web_docs})
-    web_text = (
-        web_out.get("answer") if isinstance(web_out, dict) else str(web_out)
+    # Every setting that changes the generated answer must be part of the key
+    cache_ns = (
+        f"{model or DEFAULT_MODEL}|{web_max_results or 12}"
+        f"|{max_tokens or DEFAULT_MAX_TOKENS}|{temperature}"
     )
+    try:
+        # First call loads the embedding model; keep it off the event loop
+        cached = await asyncio.to_thread(_ANSWER_CACHE.get, question, namespace=cache_ns)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return cached
+
+    web_docs = await _web_fallback_docs(question, max_pages=(web_max_results or 12))
+    # The first call may download the tokenizer; keep it off the event loop
+    web_docs = await asyncio.to_thread(_shrink_documents, web_docs)
+    llm = _get_llm(model=model, temperature=temperature, max_tokens=max_tokens)
+    web_out = await llm.ainvoke(_build_messages(question, web_docs, model))
+    web_text = str(web_out.content)
     web_sources = _format_sources_from_docs(web_docs, question=question)
-    return {"answer": web_text, "sources": web_sources}
+    result = {"answer": web_text, "sources": web_sources}
+    # Only cache answers grounded in fetched sources
+    if web_docs:
+        try:
+            # put() may embed (model load/encode) if get() failed or the memo was evicted
+            await asyncio.to_thread(_ANSWER_CACHE.put, question, result, namespace=cache_ns)
+        except Exception:
+            pass
+    return result
@@ -1,9 +1,13 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+import base64
 import os
 
-client = OpenAI(
+# Async client so concurrent requests on one worker overlap their LLM round trips
+client = AsyncOpenAI(
     api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+    timeout=60,
+    max_retries=2,
 )
 
 # Requested model mapping
@@ -18,27 +22,31 @@ MODELS = {
 }
 
 
-def ask_llm(model: str, prompt: str, image_path: str | None = None) -> str:
-    """Direct call to OpenRouter-compatible Chat Completions. If image_path is provided,
-    send a multimodal message. Returns assistant text content.
+async def ask_llm(
+    model: str,
+    prompt: str,
+    image_bytes: bytes | None = None,
+    image_mime: str = "image/png",
+) -> str:
+    """Direct call to OpenRouter-compatible Chat Completions. If image_bytes is provided,
+    send a multimodal message with the image inlined as a base64 data URL.
+    Returns assistant text content.
     """
-    if image_path:
-        with open(image_path, "rb") as img:
-            img_bytes = img.read()
-        # Some OpenRouter providers accept base64 image bytes via 'input_image'
-        # For compatibility, we use OpenAI-style content blocks.
-        response = client.chat.completions.create(
+    if image_bytes:
+        img_b64 = base64.b64encode(image_bytes).decode("ascii")
+        # OpenAI-style content blocks; OpenRouter accepts data URLs for images.
+        response = await client.chat.completions.create(
             model=model,
             messages=[{
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "input_image", "image_data": img_bytes},
+                    {"type": "image_url", "image_url": {"url": f"data:{image_mime};base64,{img_b64}"}},
                 ]
             }]
         )
     else:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}]
         )
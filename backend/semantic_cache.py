@@ -0,0 +1,117 @@
+# semantic_cache.py
+# In-process semantic cache for RAG answers, keyed by question embedding similarity.
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """Flat cosine-similarity cache of past `(embedding, payload)` entries.
+
+    Embeddings are L2-normalized and stored row-wise in one float16 matrix (half
+    the memory of float32; MRL similarity ranks are effectively unchanged), so a
+    lookup is a single matrix-vector product. Entries expire after `ttl_seconds` and the
+    least recently used entry is evicted once `capacity` is reached. `namespace`
+    keeps answers produced under different settings (e.g. model) apart.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], List[float]],
+        *,
+        threshold: float = 0.92,
+        ttl_seconds: float = 24 * 3600,
+        capacity: int = 1024,
+        embedding_memo_size: int = 256,
+    ):
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        # Allocated lazily once the embedding dimension is known
+        self._matrix: Optional[np.ndarray] = None
+        self._expires = np.zeros(capacity, dtype=np.float64)  # 0 marks an empty slot
+        # Per-slot namespace id (-1 = empty) so filtering is a vectorized compare
+        self._ns_ids = np.full(capacity, -1, dtype=np.int32)
+        self._ns_index: Dict[str, int] = {}
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._lru: "OrderedDict[int, None]" = OrderedDict()  # slot -> None, oldest first
+        # Recent question -> normalized embedding, so get() + put() embed only once
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memo_size = embedding_memo_size
+
+    def embed(self, question: str) -> np.ndarray:
+        """Return the L2-normalized embedding for `question`, memoizing recent ones."""
+        with self._lock:
+            vec = self._memo.get(question)
+            if vec is not None:
+                self._memo.move_to_end(question)
+                return vec
+        vec = np.asarray(self._embed(question), dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec = vec / norm
+        with self._lock:
+            self._memo[question] = vec
+            if len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return vec
+
+    def get(self, question: str, *, namespace: str = "") -> Optional[Dict[str, Any]]:
+        """Return a cached payload for a semantically similar question, or None."""
+        q = self.embed(question)
+        with self._lock:
+            ns_id = self._ns_index.get(namespace)
+            if self._matrix is None or ns_id is None:
+                return None
+            # Upcast for the product: numpy has no BLAS path for float16 matmul
+            scores = self._matrix.astype(np.float32) @ q
+            live = (self._expires > time.time()) & (self._ns_ids == ns_id)
+            if not live.any():
+                return None
+            scores = np.where(live, scores, -np.inf)
+            idx = int(scores.argmax())
+            if scores[idx] < self.threshold:
+                return None
+            self._lru.move_to_end(idx)
+            return dict(self._payloads[idx])
+
+    def put(self, question: str, payload: Dict[str, Any], *, namespace: str = "") -> None:
+        """Store `payload` for `question`, evicting the least recently used entry if full."""
+        q = self.embed(question)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, q.shape[0]), dtype=np.float16)
+            idx = self._free_slot()
+            self._matrix[idx] = q
+            self._expires[idx] = time.time() + self.ttl_seconds
+            self._ns_ids[idx] = self._ns_index.setdefault(namespace, len(self._ns_index))
+            self._payloads[idx] = dict(payload)
+            self._lru[idx] = None
+            self._lru.move_to_end(idx)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires[:] = 0
+            self._ns_ids[:] = -1
+            self._ns_index.clear()
+            self._payloads = [None] * self.capacity
+            self._lru.clear()
+
+    def _free_slot(self) -> int:
+        # Caller holds the lock. Prefer empty or expired slots before evicting.
+        now = time.time()
+        free = np.flatnonzero(self._expires <= now)
+        if free.size:
+            idx = int(free[0])
+            self._lru.pop(idx, None)
+            return idx
+        idx, _ = self._lru.popitem(last=False)
+        return idx
@@ -6,10 +6,19 @@ from google.oauth2 import id_token
 from google.auth.transport import requests
 from dotenv import load_dotenv
 from google.auth import exceptions as ga_exceptions
+import requests_cache
 
 # Load variables from .env if present (dev convenience)
 load_dotenv()
 
+_AUDIENCE = os.getenv('GOOGLE_CLIENT_ID')
+# One transport for all verifications. Its session honors Cache-Control on
+# Google's signing-certs endpoint, so certs are refetched only when they expire
+# rather than on every login.
+_GOOGLE_REQ = requests.Request(
+    session=requests_cache.CachedSession(backend='memory', cache_control=True, expire_after=3600)
+)
+
 def verify_google_token(id_token_str):
     """Verify a Google ID token and return its user info dict on success.
 
@@ -17,9 +26,9 @@ def verify_google_token(id_token_str):
     checking. If missing, falls back to verification without audience (less
     strict) and logs a warning to aid local development.
     """
-    audience = os.getenv('GOOGLE_CLIENT_ID')
+    audience = _AUDIENCE
+    request = _GOOGLE_REQ
     try:
-        request = requests.Request()
         if audience:
             info = id_token.verify_oauth2_token(
                 id_token_str, request, audience, clock_skew_in_seconds=10
@@ -37,7 +46,6 @@ def verify_google_token(id_token_str):
             logging.error("Google token used too early; retrying once after 2s.")
             time.sleep(2)
             try:
-                request = requests.Request()
                 if audience:
                     return id_token.verify_oauth2_token(
                         id_token_str, request, audience, clock_skew_in_seconds=10
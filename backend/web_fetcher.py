@@ -4,66 +4,256 @@
 
 from __future__ import annotations
 
+import asyncio
+import atexit
 import os
-from typing import List, Dict, Any
-from urllib.parse import quote_plus
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterable, Iterator
 
-import requests
+from cachetools import TTLCache
+import orjson
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from dotenv import load_dotenv
 
+try:  # optional: only used for large trusted-domain lists
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 load_dotenv()
 
 NCBI_KEY = os.getenv("NCBI_API_KEY")
+# Shared E-utilities params, built once (api_key only when configured)
+_BASE_PUBMED_PARAMS = {"db": "pubmed", "retmode": "json"} | ({"api_key": NCBI_KEY} if NCBI_KEY else {})
+# NCBI allows 10 requests/s with an API key, 3/s without; enforced on the
+# E-utilities adapter below, shared by every thread in the process
+NCBI_REQUESTS_PER_SECOND = 10 if NCBI_KEY else 3
+# Worker threads for fan-out helpers; more than the rate budget would only queue
+NCBI_WORKERS = NCBI_REQUESTS_PER_SECOND
 
+TRUSTED_DOMAINS = (
+    "who.int",
+    "cdc.gov",
+    "nih.gov",
+    "medlineplus.gov",
+    "pubmed.ncbi.nlm.nih.gov",
+)
+# Above this many domains, suffix matching switches to an Aho-Corasick automaton
+# (O(len(host)) regardless of list size) when pyahocorasick is installed.
+TRUSTED_AUTOMATON_MIN_DOMAINS = 32
 
-def search_pubmed_ids(query: str, retmax: int = 20) -> List[str]:
-    """Search PubMed for PMIDs using E-utilities esearch.
-    Returns a list of PMID strings.
+
+def _build_trusted_host_matcher(domains) -> Callable[[str], bool]:
+    """Return a predicate: host equals a trusted domain or is one of its subdomains."""
+    if ahocorasick is not None and len(domains) > TRUSTED_AUTOMATON_MIN_DOMAINS:
+        automaton = ahocorasick.Automaton()
+        for d in domains:
+            automaton.add_word("." + d, d)
+        automaton.make_automaton()
+
+        def _match(host: str) -> bool:
+            # "." + host so an exact domain and any subdomain both end in ".<domain>"
+            dotted = "." + host
+            last = len(dotted) - 1
+            return any(end == last for end, _ in automaton.iter(dotted))
+
+        return _match
+    pattern = re.compile(r"(?:^|\.)(?:" + "|".join(re.escape(d) for d in domains) + r")$")
+    return lambda host: pattern.search(host) is not None
+
+
+_is_trusted_host = _build_trusted_host_matcher(TRUSTED_DOMAINS)
+
+# Shared session: urllib3 keeps the NCBI / EBI HTTPS connections alive between
+# calls, so esearch -> esummary doesn't pay a second TLS handshake. Responses are
+# cached on disk (POST included, keyed on the body) honoring Cache-Control/ETag,
+# and the last good response is served if NCBI/EBI are briefly unavailable.
+_SESSION = requests_cache.CachedSession(
+    "medimind_http",
+    backend="sqlite",
+    expire_after=86400,
+    cache_control=True,
+    stale_if_error=True,
+    allowable_methods=("GET", "HEAD", "POST"),
+)
+_SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "medimind/1.0"})
+# Retry 429/5xx in-process on the pooled connection, honoring Retry-After.
+# raise_on_status=False hands the final response back so raise_for_status()
+# still reports the HTTP error to callers.
+_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET", "POST"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+
+class _MinIntervalLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        # Reserve the next slot under the lock, sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that waits on a shared limiter before each network send.
+    CachedSession serves cache hits before reaching the adapter, so only real
+    requests spend the budget; urllib3 retries back off on their own.
     """
+
+    def __init__(self, limiter: _MinIntervalLimiter, **kwargs):
+        self._limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self._limiter.wait()
+        return super().send(request, **kwargs)
+
+
+_NCBI_LIMITER = _MinIntervalLimiter(NCBI_REQUESTS_PER_SECOND)
+_SESSION.mount(
+    "https://eutils.ncbi.nlm.nih.gov",
+    _RateLimitedAdapter(_NCBI_LIMITER, pool_connections=4, pool_maxsize=16, max_retries=_RETRY),
+)
+_SESSION.mount("https://www.ebi.ac.uk", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY))
+atexit.register(_SESSION.close)
+
+
+# (query, retmax) -> PMIDs; bounded TTL keeps long-running processes from going stale
+_PMID_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_PMID_CACHE_LOCK = threading.Lock()
+
+
+def _esearch_ids(query: str, retmax: int, force_refresh: bool) -> List[str]:
     base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-    params = {
-        "db": "pubmed",
-        "term": query,
-        "retmax": retmax,
-        "retmode": "json",
-    }
-    if NCBI_KEY:
-        params["api_key"] = NCBI_KEY
-    r = requests.get(base, params=params, timeout=15)
+    params = {**_BASE_PUBMED_PARAMS, "term": query, "retmax": retmax}
+    r = _SESSION.get(base, params=params, timeout=15, force_refresh=force_refresh)
     r.raise_for_status()
-    return r.json().get("esearchresult", {}).get("idlist", [])
+    return orjson.loads(r.content).get("esearchresult", {}).get("idlist", [])
 
 
-def fetch_pubmed_summaries(pmids: List[str]) -> Dict[str, Any]:
-    """Fetch PubMed summaries for a list of PMIDs via esummary.
-    Returns JSON payload (mapping of result UIDs to summary records).
+def search_pubmed_ids(query: str, retmax: int = 20, force_refresh: bool = False) -> tuple[str, ...]:
+    """Search PubMed for PMIDs using E-utilities esearch.
+    Returns an immutable tuple of PMID strings; repeat (query, retmax) lookups are
+    served from an in-process cache. `force_refresh` bypasses both caches.
     """
-    if not pmids:
+    key = (query, retmax)
+    if not force_refresh:
+        with _PMID_CACHE_LOCK:
+            cached = _PMID_CACHE.get(key)
+        if cached is not None:
+            return cached
+    ids = tuple(_esearch_ids(query, retmax, force_refresh))
+    with _PMID_CACHE_LOCK:
+        _PMID_CACHE[key] = ids
+    return ids
+
+
+def search_pubmed_ids_many(
+    queries: List[str], retmax: int = 20, workers: int | None = None
+) -> Dict[str, List[str]]:
+    """Run many esearch queries concurrently on the shared session.
+    Returns {query: [PMID, ...]} in input order; a failed query maps to [].
+    """
+    unique = list(dict.fromkeys(queries))
+    if not unique:
         return {}
+
+    def _one(q: str) -> List[str]:
+        try:
+            return list(search_pubmed_ids(q, retmax))
+        except Exception:
+            return []
+
+    with ThreadPoolExecutor(max_workers=min(workers or NCBI_WORKERS, len(unique))) as ex:
+        return dict(zip(unique, ex.map(_one, unique)))
+
+
+ESUMMARY_CHUNK = 200  # NCBI's documented max UIDs per esummary request
+
+
+def _fetch_pubmed_summary_chunk(pmids: List[str], force_refresh: bool = False) -> Dict[str, Any]:
     base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
-    params = {
-        "db": "pubmed",
-        "id": ",".join(pmids),
-        "retmode": "json",
-    }
-    if NCBI_KEY:
-        params["api_key"] = NCBI_KEY
-    r = requests.get(base, params=params, timeout=15)
+    data = {**_BASE_PUBMED_PARAMS, "id": ",".join(pmids)}
+    # POST keeps long id lists out of the URL
+    r = _SESSION.post(base, data=data, timeout=15, force_refresh=force_refresh)
     r.raise_for_status()
-    return r.json()
+    return orjson.loads(r.content)
+
 
+def fetch_pubmed_summaries(pmids: List[str], force_refresh: bool = False) -> Dict[str, Any]:
+    """Fetch PubMed summaries for a list of PMIDs via esummary.
+    Large lists are split into ESUMMARY_CHUNK-sized batches fetched concurrently
+    and merged. Returns JSON payload (mapping of result UIDs to summary records).
+    `force_refresh` bypasses the HTTP cache.
+    """
+    if not pmids:
+        return {}
+    chunks = [pmids[i:i + ESUMMARY_CHUNK] for i in range(0, len(pmids), ESUMMARY_CHUNK)]
+    if len(chunks) == 1:
+        return _fetch_pubmed_summary_chunk(chunks[0], force_refresh)
+    with ThreadPoolExecutor(max_workers=min(NCBI_WORKERS, len(chunks))) as ex:
+        payloads = list(ex.map(_fetch_pubmed_summary_chunk, chunks, [force_refresh] * len(chunks)))
+    merged: Dict[str, Any] = dict(payloads[0])
+    result: Dict[str, Any] = {"uids": []}
+    for payload in payloads:
+        part = payload.get("result", {})
+        result["uids"].extend(part.get("uids", []))
+        result.update((k, v) for k, v in part.items() if k != "uids")
+    merged["result"] = result
+    return merged
 
-def search_europepmc(query: str, page_size: int = 10) -> Dict[str, Any]:
+
+def search_europepmc(query: str, page_size: int = 10, force_refresh: bool = False) -> Dict[str, Any]:
     """Search Europe PMC JSON service for OA/metadata.
-    Returns JSON response.
+    Returns JSON response. `force_refresh` bypasses the HTTP cache.
     """
-    url = (
-        "https://www.ebi.ac.uk/europepmc/webservices/rest/search?"
-        f"query={quote_plus(query)}&format=json&pageSize={page_size}"
-    )
-    r = requests.get(url, timeout=15)
+    url = "https://www.ebi.ac.uk/europepmc/webservices/rest/search"
+    params = {
+        "query": query,
+        "format": "json",
+        "pageSize": page_size,
+    }
+    r = _SESSION.get(url, params=params, timeout=15, force_refresh=force_refresh)
     r.raise_for_status()
-    return r.json()
+    return orjson.loads(r.content)
+
+
+# Async variants: run the session-backed calls in worker threads so callers can
+# overlap them, e.g. asyncio.gather(search_pubmed_ids_async(q), search_europepmc_async(q)).
+async def search_pubmed_ids_async(
+    query: str, retmax: int = 20, force_refresh: bool = False
+) -> tuple[str, ...]:
+    return await asyncio.to_thread(search_pubmed_ids, query, retmax, force_refresh)
+
+
+async def fetch_pubmed_summaries_async(pmids: List[str], force_refresh: bool = False) -> Dict[str, Any]:
+    return await asyncio.to_thread(fetch_pubmed_summaries, pmids, force_refresh)
+
+
+async def search_europepmc_async(
+    query: str, page_size: int = 10, force_refresh: bool = False
+) -> Dict[str, Any]:
+    return await asyncio.to_thread(search_europepmc, query, page_size, force_refresh)
 
 
 # You can extend with WHO/CDC/ClinicalTrials specific API calls when you provide the exact endpoints.
@@ -72,23 +262,36 @@ def search_europepmc(query: str, page_size: int = 10) -> Dict[str, Any]:
 # Removed Google Custom Search integration. Web search is handled via Tavily or DDGS in `rag.py`.
 
 
+# scheme://authority, with "//" directly after the scheme. The authority ends at
+# "/", "?", "#" or a backslash (browsers/WHATWG treat it as a path separator).
+_AUTHORITY_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.\-]*://([^/?#\\]*)")
+
+
+def _fast_host(url: str) -> str:
+    r"""Lowercased host of scheme://[userinfo@]host[:port]/... by string slicing.
+    Returns "" for anything without a "//" authority right after the scheme, so
+    malformed input simply fails the trusted-host match.
+
+    >>> _fast_host("https://u:p@WWW.CDC.gov:443/a?b#c")
+    'www.cdc.gov'
+    >>> _fast_host("https://evil.com\\@who.int/")
+    'evil.com'
+    >>> _fast_host("mailto:a?r=//cdc.gov")
+    ''
+    """
+    if not isinstance(url, str):
+        return ""
+    m = _AUTHORITY_RE.match(url)
+    if not m:
+        return ""
+    return m.group(1).rpartition("@")[2].split(":", 1)[0].lower()
+
+
+def iter_trusted(urls: Iterable[str]) -> Iterator[str]:
+    """Lazily yield URLs on trusted medical domains (or their subdomains)."""
+    return (u for u in urls if _is_trusted_host(_fast_host(u)))
+
+
 def filter_trusted(urls: list[str]) -> list[str]:
     """Filter URLs to a stable set of trusted medical domains."""
-    from urllib.parse import urlparse
-    trusted = {
-        "who.int",
-        "cdc.gov",
-        "nih.gov",
-        "medlineplus.gov",
-        "pubmed.ncbi.nlm.nih.gov",
-    }
-    out = []
-    for u in urls:
-        try:
-            host = urlparse(u).netloc.lower()
-            # allow subdomains of trusted domains
-            if any(host == d or host.endswith("." + d) for d in trusted):
-                out.append(u)
-        except Exception:
-            continue
-    return out
+    return [u for u in urls if _is_trusted_host(_fast_host(u))]